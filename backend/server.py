@@ -1,41 +1,123 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field, EmailStr, field_validator
+from typing import List, Optional, Tuple
+from collections import OrderedDict
 import uuid
-from datetime import datetime, timedelta
+import hmac
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+import jwt
 import httpx
+import orjson
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=200,
+    minPoolSize=20,
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=2000
+)
 db = client[os.environ.get('DB_NAME', 'collaborative_todo')]
 
 # Security settings
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 REFRESH_SECRET = os.environ.get('JWT_REFRESH_SECRET', 'your-refresh-secret-key')
 ALGORITHM = "HS256"
+SIGNING_KEY = SECRET_KEY.encode()
+REFRESH_SIGNING_KEY = REFRESH_SECRET.encode()
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TTL_SECONDS = 60
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# max_rounds flags older cost-12 hashes for rehashing on their next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=10, bcrypt__max_rounds=10, deprecated="auto")
+VERIFY_CACHE_SIZE = 1024
+VERIFY_CACHE_TTL_SECONDS = 30
+# Verified against when the account is unknown, so login timing doesn't reveal which emails exist
+DUMMY_HASH = pwd_context.hash("dummy-password")
 security = HTTPBearer(auto_error=False)
 
+# Users are loaded without the password hash unless it is actually needed
+USER_FIELDS = {"_id": 0, "password_hash": 0}
+
+# Fields loaded by the list endpoints; each row still goes through its *_response helper
+TASK_FIELDS = {
+    "_id": 0, "id": 1, "title": 1, "description": 1, "status": 1, "priority": 1,
+    "due_date": 1, "user_id": 1, "created_at": 1, "updated_at": 1
+}
+GROUP_FIELDS = {
+    "_id": 0, "id": 1, "name": 1, "description": 1, "owner_id": 1, "members": 1, "created_at": 1
+}
+GROUP_TASK_FIELDS = {
+    "_id": 0, "id": 1, "title": 1, "description": 1, "status": 1, "priority": 1, "due_date": 1,
+    "group_id": 1, "created_by": 1, "assigned_to": 1, "assigned_to_name": 1,
+    "created_at": 1, "updated_at": 1
+}
+
+async def backfill_member_ids():
+    # Groups created before member_ids existed get it derived from their members
+    await db.groups.update_many(
+        {"member_ids": {"$exists": False}},
+        [{"$set": {"member_ids": "$members.user_id"}}]
+    )
+
+async def ensure_indexes():
+    await db.users.create_index("email", unique=True)
+    await db.users.create_index("id", unique=True)
+    await db.tasks.create_index("id", unique=True)
+    await db.tasks.create_index([("user_id", 1), ("created_at", -1)])
+    await db.groups.create_index("id", unique=True)
+    await db.groups.create_index("member_ids")
+    await db.group_tasks.create_index("id", unique=True)
+    await db.group_tasks.create_index([("group_id", 1), ("created_at", -1)])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve requests even if Mongo is briefly unreachable or old duplicates block an index
+    try:
+        await backfill_member_ids()
+        await ensure_indexes()
+    except PyMongoError:
+        logger.exception("Failed to prepare MongoDB indexes at startup")
+    
+    # Shared HTTP client so outbound calls reuse keep-alive connections
+    app.state.http = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+    yield
+    await app.state.http.aclose()
+    client.close()
+
 # Create the main app without a prefix
-app = FastAPI(title="Collaborative Todo API")
+app = FastAPI(
+    title="Collaborative Todo API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -50,6 +132,12 @@ logger = logging.getLogger(__name__)
 
 # ============== MODELS ==============
 
+def reject_null(value):
+    # Omitted fields are left alone, but these can't be cleared with an explicit null
+    if value is None:
+        raise ValueError("may not be null")
+    return value
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
@@ -91,6 +179,8 @@ class TaskUpdate(BaseModel):
     priority: Optional[str] = None
     due_date: Optional[str] = None
 
+    _not_null = field_validator("title", "description", "status", "priority")(reject_null)
+
 class Task(BaseModel):
     id: str
     title: str
@@ -110,6 +200,8 @@ class GroupUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
 
+    _not_null = field_validator("name", "description")(reject_null)
+
 class InviteMemberRequest(BaseModel):
     email: EmailStr
     role: str = "member"  # admin, member, viewer
@@ -129,80 +221,208 @@ class GroupTaskUpdate(BaseModel):
     assigned_to: Optional[str] = None
     due_date: Optional[str] = None
 
+    _not_null = field_validator("title", "description", "status", "priority")(reject_null)
+
 
 # ============== HELPERS ==============
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+# Recent bcrypt results keyed by HMAC(email|password|hash|time bucket), so plaintext is never kept
+_verify_cache: "OrderedDict[bytes, bool]" = OrderedDict()
+
+async def verify_password_cached(email: str, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # The email is part of the key so unknown accounts, which all share DUMMY_HASH,
+    # are cached per address exactly like real ones. No fallback around the cache: building
+    # the key only fails on input bcrypt would reject too, and dict operations can't fail.
+    bucket = int(time.time() // VERIFY_CACHE_TTL_SECONDS)
+    key = hmac.new(
+        SIGNING_KEY,
+        f"{email}|{plain_password}|{hashed_password}|{bucket}".encode(),
+        hashlib.sha256
+    ).digest()
+    
+    result = _verify_cache.get(key)
+    if result is not None:
+        _verify_cache.move_to_end(key)
+        return result, None
+    
+    # bcrypt is CPU bound, keep it off the event loop
+    result, new_hash = await asyncio.to_thread(pwd_context.verify_and_update, plain_password, hashed_password)
+    _verify_cache[key] = result
+    if len(_verify_cache) > VERIFY_CACHE_SIZE:
+        _verify_cache.popitem(last=False)
+    return result, new_hash
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, now: Optional[int] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire, "type": "access"})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    issued_at = now if now is not None else int(time.time())
+    expires_in = expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"iat": issued_at, "exp": issued_at + int(expires_in.total_seconds()), "type": "access"})
+    return jwt.encode(to_encode, SIGNING_KEY, algorithm=ALGORITHM)
 
-def create_refresh_token(data: dict) -> str:
+def create_refresh_token(data: dict, now: Optional[int] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
-    return jwt.encode(to_encode, REFRESH_SECRET, algorithm=ALGORITHM)
+    issued_at = now if now is not None else int(time.time())
+    to_encode.update({"iat": issued_at, "exp": issued_at + REFRESH_TOKEN_EXPIRE_DAYS * 86400, "type": "refresh"})
+    return jwt.encode(to_encode, REFRESH_SIGNING_KEY, algorithm=ALGORITHM)
+
+def create_token_pair(user_id: str) -> Tuple[str, str]:
+    # Both tokens share one issue time
+    now = int(time.time())
+    return (
+        create_access_token({"sub": user_id}, now=now),
+        create_refresh_token({"sub": user_id}, now=now)
+    )
+
+# Access token -> (user, expires_at) for recently authenticated requests
+_auth_cache: "OrderedDict[str, tuple]" = OrderedDict()
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    token = credentials.credentials
+    now = time.time()
+    cached = _auth_cache.get(token)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > now:
+            _auth_cache.move_to_end(token)
+            return user
+        del _auth_cache[token]
+    
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None or payload.get("type") != "access":
             raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await db.users.find_one({"id": user_id})
+    user = await db.users.find_one({"id": user_id}, USER_FIELDS)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     
+    _auth_cache[token] = (user, min(payload["exp"], now + AUTH_CACHE_TTL_SECONDS))
+    if len(_auth_cache) > AUTH_CACHE_SIZE:
+        _auth_cache.popitem(last=False)
+    
     return user
 
+async def list_etag(collection, match: dict, scope: str) -> str:
+    # A list changes whenever its size or its latest updated_at does
+    stats = await collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "last_updated": {"$max": "$updated_at"}}}
+    ]).to_list(1)
+    count = stats[0]["count"] if stats else 0
+    last_updated = stats[0]["last_updated"] if stats and stats[0]["last_updated"] else ""
+    last_updated = last_updated.isoformat() if isinstance(last_updated, datetime) else str(last_updated)
+    digest = hashlib.sha256(f"{scope}-{count}-{last_updated}".encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+async def stream_json_array(cursor, serialize):
+    # Encode documents as the cursor yields them instead of materializing the whole list
+    yield b"["
+    first = True
+    async for doc in cursor:
+        if not first:
+            yield b","
+        yield orjson.dumps(serialize(doc), option=orjson.OPT_NAIVE_UTC)
+        first = False
+    yield b"]"
+
 def user_response(user: dict) -> dict:
     return {
         "id": user["id"],
         "email": user["email"],
         "name": user["name"],
         "picture": user.get("picture"),
+        # Pre-formatted so TokenResponse.user matches the +00:00 form of other endpoints
         "created_at": user["created_at"].isoformat() if isinstance(user["created_at"], datetime) else user["created_at"]
     }
 
+def task_response(task: dict) -> dict:
+    return {
+        "id": task["id"],
+        "title": task["title"],
+        "description": task.get("description", ""),
+        "status": task.get("status", "todo"),
+        "priority": task.get("priority", "medium"),
+        "due_date": task.get("due_date"),
+        "user_id": task["user_id"],
+        "created_at": task["created_at"],
+        "updated_at": task["updated_at"]
+    }
+
+def group_response(group: dict) -> dict:
+    return {
+        "id": group["id"],
+        "name": group["name"],
+        "description": group.get("description", ""),
+        "owner_id": group["owner_id"],
+        "members": group["members"],
+        "created_at": group["created_at"]
+    }
+
+def group_task_response(task: dict) -> dict:
+    return {
+        "id": task["id"],
+        "title": task["title"],
+        "description": task.get("description", ""),
+        "status": task.get("status", "todo"),
+        "priority": task.get("priority", "medium"),
+        "due_date": task.get("due_date"),
+        "group_id": task["group_id"],
+        "created_by": task["created_by"],
+        "assigned_to": task.get("assigned_to"),
+        "assigned_to_name": task.get("assigned_to_name"),
+        "created_at": task["created_at"],
+        "updated_at": task["updated_at"]
+    }
+
 
 # ============== AUTH ROUTES ==============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email.lower()})
+    existing = await db.users.find_one({"email": user_data.email.lower()}, {"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
     user_id = str(uuid.uuid4())
+    password_hash = await asyncio.to_thread(get_password_hash, user_data.password)
     user = {
         "id": user_id,
         "email": user_data.email.lower(),
         "name": user_data.name,
-        "password_hash": get_password_hash(user_data.password),
+        "password_hash": password_hash,
         "picture": None,
-        "created_at": datetime.utcnow()
+        "created_at": utc_now()
     }
     
-    await db.users.insert_one(user)
+    try:
+        await db.users.insert_one(user)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Generate tokens
-    access_token = create_access_token({"sub": user_id})
-    refresh_token = create_refresh_token({"sub": user_id})
+    access_token, refresh_token = create_token_pair(user_id)
     
     return TokenResponse(
         access_token=access_token,
@@ -212,16 +432,21 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email.lower()})
+    email = credentials.email.lower()
+    user = await db.users.find_one({"email": email}, {"_id": 0})
     
-    if not user or not user.get("password_hash"):
-        raise HTTPException(status_code=401, detail="Invalid email or password")
+    password_hash = user.get("password_hash") if user else None
     
-    if not verify_password(credentials.password, user["password_hash"]):
+    # Always pay for one bcrypt check, even when there is no password to compare
+    password_ok, new_hash = await verify_password_cached(email, credentials.password, password_hash or DUMMY_HASH)
+    if not password_hash or not password_ok:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    access_token = create_access_token({"sub": user["id"]})
-    refresh_token = create_refresh_token({"sub": user["id"]})
+    # Bring legacy hashes down to the current cost so they time the same as DUMMY_HASH
+    if new_hash:
+        await db.users.update_one({"id": user["id"]}, {"$set": {"password_hash": new_hash}})
+    
+    access_token, refresh_token = create_token_pair(user["id"])
     
     return TokenResponse(
         access_token=access_token,
@@ -230,34 +455,34 @@ async def login(credentials: UserLogin):
     )
 
 @api_router.post("/auth/google", response_model=TokenResponse)
-async def google_auth(auth_data: GoogleAuthRequest):
+async def google_auth(auth_data: GoogleAuthRequest, request: Request):
     if not GOOGLE_CLIENT_ID:
         raise HTTPException(status_code=400, detail="Google OAuth is not configured")
     
     # Verify the Google ID token
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://oauth2.googleapis.com/tokeninfo?id_token={auth_data.id_token}"
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid Google token")
-            
-            google_data = response.json()
-            
-            # Verify the audience matches our client ID
-            if google_data.get("aud") != GOOGLE_CLIENT_ID:
-                raise HTTPException(status_code=401, detail="Invalid token audience")
-            
-            email = google_data.get("email")
-            name = google_data.get("name", email.split("@")[0])
-            picture = google_data.get("picture")
-            
+        response = await request.app.state.http.get(
+            "https://oauth2.googleapis.com/tokeninfo",
+            params={"id_token": auth_data.id_token}
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid Google token")
+        
+        google_data = response.json()
+        
+        # Verify the audience matches our client ID
+        if google_data.get("aud") != GOOGLE_CLIENT_ID:
+            raise HTTPException(status_code=401, detail="Invalid token audience")
+        
+        email = google_data.get("email")
+        name = google_data.get("name", email.split("@")[0])
+        picture = google_data.get("picture")
+        
     except httpx.RequestError:
         raise HTTPException(status_code=500, detail="Failed to verify Google token")
     
     # Find or create user
-    user = await db.users.find_one({"email": email.lower()})
+    user = await db.users.find_one({"email": email.lower()}, USER_FIELDS)
     
     if user:
         # Update picture if available
@@ -273,12 +498,15 @@ async def google_auth(auth_data: GoogleAuthRequest):
             "name": name,
             "picture": picture,
             "password_hash": None,  # Google auth users don't have a password
-            "created_at": datetime.utcnow()
+            "created_at": utc_now()
         }
-        await db.users.insert_one(user)
+        try:
+            await db.users.insert_one(user)
+        except DuplicateKeyError:
+            # A concurrent first login created the account; use that one
+            user = await db.users.find_one({"email": email.lower()}, USER_FIELDS)
     
-    access_token = create_access_token({"sub": user["id"]})
-    refresh_token = create_refresh_token({"sub": user["id"]})
+    access_token, refresh_token = create_token_pair(user["id"])
     
     return TokenResponse(
         access_token=access_token,
@@ -289,19 +517,18 @@ async def google_auth(auth_data: GoogleAuthRequest):
 @api_router.post("/auth/refresh", response_model=TokenResponse)
 async def refresh_token(data: RefreshTokenRequest):
     try:
-        payload = jwt.decode(data.refresh_token, REFRESH_SECRET, algorithms=[ALGORITHM])
+        payload = jwt.decode(data.refresh_token, REFRESH_SIGNING_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None or payload.get("type") != "refresh":
             raise HTTPException(status_code=401, detail="Invalid refresh token")
-    except JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     
-    user = await db.users.find_one({"id": user_id})
+    user = await db.users.find_one({"id": user_id}, USER_FIELDS)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    access_token = create_access_token({"sub": user_id})
-    new_refresh_token = create_refresh_token({"sub": user_id})
+    access_token, new_refresh_token = create_token_pair(user_id)
     
     return TokenResponse(
         access_token=access_token,
@@ -317,24 +544,20 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 # ============== TASKS ROUTES ==============
 
 @api_router.get("/tasks")
-async def get_tasks(current_user: dict = Depends(get_current_user)):
-    tasks = await db.tasks.find({"user_id": current_user["id"]}).sort("created_at", -1).to_list(1000)
-    return [{
-        "id": t["id"],
-        "title": t["title"],
-        "description": t.get("description", ""),
-        "status": t.get("status", "todo"),
-        "priority": t.get("priority", "medium"),
-        "due_date": t.get("due_date"),
-        "user_id": t["user_id"],
-        "created_at": t["created_at"].isoformat() if isinstance(t["created_at"], datetime) else t["created_at"],
-        "updated_at": t["updated_at"].isoformat() if isinstance(t["updated_at"], datetime) else t["updated_at"]
-    } for t in tasks]
+async def get_tasks(request: Request, current_user: dict = Depends(get_current_user)):
+    etag = await list_etag(db.tasks, {"user_id": current_user["id"]}, current_user["id"])
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    cursor = db.tasks.find(
+        {"user_id": current_user["id"]}, TASK_FIELDS
+    ).sort("created_at", -1).limit(1000)
+    return StreamingResponse(stream_json_array(cursor, task_response), media_type="application/json", headers={"ETag": etag})
 
 @api_router.post("/tasks")
 async def create_task(task_data: TaskCreate, current_user: dict = Depends(get_current_user)):
     task_id = str(uuid.uuid4())
-    now = datetime.utcnow()
+    now = utc_now()
     
     task = {
         "id": task_id,
@@ -350,41 +573,23 @@ async def create_task(task_data: TaskCreate, current_user: dict = Depends(get_cu
     
     await db.tasks.insert_one(task)
     
-    return {
-        "id": task["id"],
-        "title": task["title"],
-        "description": task["description"],
-        "status": task["status"],
-        "priority": task["priority"],
-        "due_date": task["due_date"],
-        "user_id": task["user_id"],
-        "created_at": task["created_at"].isoformat(),
-        "updated_at": task["updated_at"].isoformat()
-    }
+    return task_response(task)
 
 @api_router.patch("/tasks/{task_id}")
 async def update_task(task_id: str, updates: TaskUpdate, current_user: dict = Depends(get_current_user)):
-    task = await db.tasks.find_one({"id": task_id, "user_id": current_user["id"]})
-    if not task:
+    update_data = updates.model_dump(exclude_unset=True)
+    update_data["updated_at"] = utc_now()
+    
+    updated_task = await db.tasks.find_one_and_update(
+        {"id": task_id, "user_id": current_user["id"]},
+        {"$set": update_data},
+        projection=TASK_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    update_data = {k: v for k, v in updates.dict().items() if v is not None}
-    update_data["updated_at"] = datetime.utcnow()
-    
-    await db.tasks.update_one({"id": task_id}, {"$set": update_data})
-    
-    updated_task = await db.tasks.find_one({"id": task_id})
-    return {
-        "id": updated_task["id"],
-        "title": updated_task["title"],
-        "description": updated_task.get("description", ""),
-        "status": updated_task.get("status", "todo"),
-        "priority": updated_task.get("priority", "medium"),
-        "due_date": updated_task.get("due_date"),
-        "user_id": updated_task["user_id"],
-        "created_at": updated_task["created_at"].isoformat() if isinstance(updated_task["created_at"], datetime) else updated_task["created_at"],
-        "updated_at": updated_task["updated_at"].isoformat() if isinstance(updated_task["updated_at"], datetime) else updated_task["updated_at"]
-    }
+    return task_response(updated_task)
 
 @api_router.delete("/tasks/{task_id}")
 async def delete_task(task_id: str, current_user: dict = Depends(get_current_user)):
@@ -400,22 +605,15 @@ async def delete_task(task_id: str, current_user: dict = Depends(get_current_use
 async def get_groups(current_user: dict = Depends(get_current_user)):
     # Find groups where user is a member
     groups = await db.groups.find({
-        "members.user_id": current_user["id"]
-    }).sort("created_at", -1).to_list(1000)
-    
-    return [{
-        "id": g["id"],
-        "name": g["name"],
-        "description": g.get("description", ""),
-        "owner_id": g["owner_id"],
-        "members": g["members"],
-        "created_at": g["created_at"].isoformat() if isinstance(g["created_at"], datetime) else g["created_at"]
-    } for g in groups]
+        "member_ids": current_user["id"]
+    }, GROUP_FIELDS).sort("created_at", -1).to_list(1000)
+    
+    return ORJSONResponse([group_response(g) for g in groups])
 
 @api_router.post("/groups")
 async def create_group(group_data: GroupCreate, current_user: dict = Depends(get_current_user)):
     group_id = str(uuid.uuid4())
-    now = datetime.utcnow()
+    now = utc_now()
     
     group = {
         "id": group_id,
@@ -429,69 +627,56 @@ async def create_group(group_data: GroupCreate, current_user: dict = Depends(get
             "role": "owner",
             "joined_at": now.isoformat()
         }],
+        # Flat copy of members' user ids for indexed membership checks
+        "member_ids": [current_user["id"]],
         "created_at": now
     }
     
     await db.groups.insert_one(group)
     
-    return {
-        "id": group["id"],
-        "name": group["name"],
-        "description": group["description"],
-        "owner_id": group["owner_id"],
-        "members": group["members"],
-        "created_at": group["created_at"].isoformat()
-    }
+    return group_response(group)
 
 @api_router.get("/groups/{group_id}")
 async def get_group(group_id: str, current_user: dict = Depends(get_current_user)):
     group = await db.groups.find_one({
         "id": group_id,
-        "members.user_id": current_user["id"]
-    })
+        "member_ids": current_user["id"]
+    }, GROUP_FIELDS)
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    return {
-        "id": group["id"],
-        "name": group["name"],
-        "description": group.get("description", ""),
-        "owner_id": group["owner_id"],
-        "members": group["members"],
-        "created_at": group["created_at"].isoformat() if isinstance(group["created_at"], datetime) else group["created_at"]
-    }
+    return group_response(group)
 
 @api_router.patch("/groups/{group_id}")
 async def update_group(group_id: str, updates: GroupUpdate, current_user: dict = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if user is owner or admin
-    member = next((m for m in group["members"] if m["user_id"] == current_user["id"]), None)
-    if not member or member["role"] not in ["owner", "admin"]:
-        raise HTTPException(status_code=403, detail="Not authorized to update group")
-    
-    update_data = {k: v for k, v in updates.dict().items() if v is not None}
+    update_data = updates.model_dump(exclude_unset=True)
     
+    # Only owners and admins may update the group
+    query = {
+        "id": group_id,
+        "members": {"$elemMatch": {"user_id": current_user["id"], "role": {"$in": ["owner", "admin"]}}}
+    }
     if update_data:
-        await db.groups.update_one({"id": group_id}, {"$set": update_data})
+        updated_group = await db.groups.find_one_and_update(
+            query,
+            {"$set": update_data},
+            projection=GROUP_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+    else:
+        updated_group = await db.groups.find_one(query, GROUP_FIELDS)
     
-    updated_group = await db.groups.find_one({"id": group_id})
-    return {
-        "id": updated_group["id"],
-        "name": updated_group["name"],
-        "description": updated_group.get("description", ""),
-        "owner_id": updated_group["owner_id"],
-        "members": updated_group["members"],
-        "created_at": updated_group["created_at"].isoformat() if isinstance(updated_group["created_at"], datetime) else updated_group["created_at"]
-    }
+    if not updated_group:
+        if await db.groups.find_one({"id": group_id}, {"_id": 1}):
+            raise HTTPException(status_code=403, detail="Not authorized to update group")
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    return group_response(updated_group)
 
 @api_router.delete("/groups/{group_id}")
 async def delete_group(group_id: str, current_user: dict = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
+    group = await db.groups.find_one({"id": group_id}, {"_id": 0, "owner_id": 1})
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -508,123 +693,117 @@ async def delete_group(group_id: str, current_user: dict = Depends(get_current_u
     
     return {"message": "Group deleted"}
 
-@api_router.post("/groups/{group_id}/invite")
-async def invite_member(group_id: str, invite: InviteMemberRequest, current_user: dict = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    
+async def ensure_can_invite(group_id: str, user_id: str):
+    group = await db.groups.find_one({"id": group_id}, {"_id": 0, "members": 1})
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    # Check if user is owner or admin
-    member = next((m for m in group["members"] if m["user_id"] == current_user["id"]), None)
+    member = next((m for m in group["members"] if m["user_id"] == user_id), None)
     if not member or member["role"] not in ["owner", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized to invite members")
-    
+
+@api_router.post("/groups/{group_id}/invite")
+async def invite_member(group_id: str, invite: InviteMemberRequest, current_user: dict = Depends(get_current_user)):
     # Find user to invite
-    invitee = await db.users.find_one({"email": invite.email.lower()})
+    invitee = await db.users.find_one(
+        {"email": invite.email.lower()}, {"_id": 0, "id": 1, "name": 1, "email": 1}
+    )
     if not invitee:
+        # Only tell owners/admins whether an email is registered
+        await ensure_can_invite(group_id, current_user["id"])
         raise HTTPException(status_code=404, detail="User not found. They need to register first.")
     
-    # Check if already a member
-    if any(m["user_id"] == invitee["id"] for m in group["members"]):
-        raise HTTPException(status_code=400, detail="User is already a member of this group")
-    
-    # Add member
     new_member = {
         "user_id": invitee["id"],
         "user_name": invitee["name"],
         "user_email": invitee["email"],
         "role": invite.role,
-        "joined_at": datetime.utcnow().isoformat()
+        "joined_at": utc_now().isoformat()
     }
     
-    await db.groups.update_one(
-        {"id": group_id},
-        {"$push": {"members": new_member}}
+    # Add member only if the inviter is owner/admin and the invitee isn't already in
+    updated_group = await db.groups.find_one_and_update(
+        {
+            "id": group_id,
+            "members": {"$elemMatch": {"user_id": current_user["id"], "role": {"$in": ["owner", "admin"]}}},
+            "member_ids": {"$ne": invitee["id"]}
+        },
+        {"$addToSet": {"members": new_member, "member_ids": invitee["id"]}},
+        projection=GROUP_FIELDS,
+        return_document=ReturnDocument.AFTER
     )
     
-    updated_group = await db.groups.find_one({"id": group_id})
-    return {
-        "id": updated_group["id"],
-        "name": updated_group["name"],
-        "description": updated_group.get("description", ""),
-        "owner_id": updated_group["owner_id"],
-        "members": updated_group["members"],
-        "created_at": updated_group["created_at"].isoformat() if isinstance(updated_group["created_at"], datetime) else updated_group["created_at"]
-    }
+    if not updated_group:
+        await ensure_can_invite(group_id, current_user["id"])
+        raise HTTPException(status_code=400, detail="User is already a member of this group")
+    
+    return group_response(updated_group)
 
 @api_router.delete("/groups/{group_id}/members/{member_id}")
 async def remove_member(group_id: str, member_id: str, current_user: dict = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check permissions
-    current_member = next((m for m in group["members"] if m["user_id"] == current_user["id"]), None)
-    target_member = next((m for m in group["members"] if m["user_id"] == member_id), None)
-    
-    if not current_member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    if not target_member:
-        raise HTTPException(status_code=404, detail="Member not found")
-    
-    # Can't remove owner
-    if target_member["role"] == "owner":
-        raise HTTPException(status_code=400, detail="Cannot remove the group owner")
-    
-    # Only owner/admin can remove others, but anyone can remove themselves
+    # The owner can't be removed; only owner/admin can remove others, but anyone can remove themselves
+    conditions = [{"members": {"$elemMatch": {"user_id": member_id, "role": {"$ne": "owner"}}}}]
     if member_id != current_user["id"]:
-        if current_member["role"] not in ["owner", "admin"]:
-            raise HTTPException(status_code=403, detail="Not authorized to remove members")
+        conditions.append({"members": {"$elemMatch": {"user_id": current_user["id"], "role": {"$in": ["owner", "admin"]}}}})
     
-    # Remove member
-    await db.groups.update_one(
-        {"id": group_id},
-        {"$pull": {"members": {"user_id": member_id}}}
+    result = await db.groups.update_one(
+        {"id": group_id, "$and": conditions},
+        {"$pull": {"members": {"user_id": member_id}, "member_ids": member_id}}
     )
     
+    if result.modified_count == 0:
+        group = await db.groups.find_one({"id": group_id}, {"_id": 0, "members": 1})
+        
+        if not group:
+            raise HTTPException(status_code=404, detail="Group not found")
+        
+        # Work out why the removal was rejected
+        current_member = next((m for m in group["members"] if m["user_id"] == current_user["id"]), None)
+        target_member = next((m for m in group["members"] if m["user_id"] == member_id), None)
+        
+        if not current_member:
+            raise HTTPException(status_code=403, detail="You are not a member of this group")
+        
+        if not target_member:
+            raise HTTPException(status_code=404, detail="Member not found")
+        
+        if target_member["role"] == "owner":
+            raise HTTPException(status_code=400, detail="Cannot remove the group owner")
+        
+        raise HTTPException(status_code=403, detail="Not authorized to remove members")
+    
     return {"message": "Member removed"}
 
 
 # ============== GROUP TASKS ROUTES ==============
 
 @api_router.get("/groups/{group_id}/tasks")
-async def get_group_tasks(group_id: str, current_user: dict = Depends(get_current_user)):
-    # Verify membership
-    group = await db.groups.find_one({
-        "id": group_id,
-        "members.user_id": current_user["id"]
-    })
+async def get_group_tasks(group_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    # Verify membership while the ETag is computed; it's discarded if access is denied
+    group, etag = await asyncio.gather(
+        db.groups.find_one({"id": group_id, "member_ids": current_user["id"]}, {"_id": 1}),
+        list_etag(db.group_tasks, {"group_id": group_id}, group_id)
+    )
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found or access denied")
     
-    tasks = await db.group_tasks.find({"group_id": group_id}).sort("created_at", -1).to_list(1000)
-    
-    return [{
-        "id": t["id"],
-        "title": t["title"],
-        "description": t.get("description", ""),
-        "status": t.get("status", "todo"),
-        "priority": t.get("priority", "medium"),
-        "due_date": t.get("due_date"),
-        "group_id": t["group_id"],
-        "created_by": t["created_by"],
-        "assigned_to": t.get("assigned_to"),
-        "assigned_to_name": t.get("assigned_to_name"),
-        "created_at": t["created_at"].isoformat() if isinstance(t["created_at"], datetime) else t["created_at"],
-        "updated_at": t["updated_at"].isoformat() if isinstance(t["updated_at"], datetime) else t["updated_at"]
-    } for t in tasks]
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    cursor = db.group_tasks.find(
+        {"group_id": group_id}, GROUP_TASK_FIELDS
+    ).sort("created_at", -1).limit(1000)
+    
+    return StreamingResponse(stream_json_array(cursor, group_task_response), media_type="application/json", headers={"ETag": etag})
 
 @api_router.post("/groups/{group_id}/tasks")
 async def create_group_task(group_id: str, task_data: GroupTaskCreate, current_user: dict = Depends(get_current_user)):
     # Verify membership and role
     group = await db.groups.find_one({
         "id": group_id,
-        "members.user_id": current_user["id"]
-    })
+        "member_ids": current_user["id"]
+    }, {"_id": 0, "members": 1})
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found or access denied")
@@ -641,7 +820,7 @@ async def create_group_task(group_id: str, task_data: GroupTaskCreate, current_u
             assigned_to_name = assigned_member["user_name"]
     
     task_id = str(uuid.uuid4())
-    now = datetime.utcnow()
+    now = utc_now()
     
     task = {
         "id": task_id,
@@ -660,28 +839,15 @@ async def create_group_task(group_id: str, task_data: GroupTaskCreate, current_u
     
     await db.group_tasks.insert_one(task)
     
-    return {
-        "id": task["id"],
-        "title": task["title"],
-        "description": task["description"],
-        "status": task["status"],
-        "priority": task["priority"],
-        "due_date": task["due_date"],
-        "group_id": task["group_id"],
-        "created_by": task["created_by"],
-        "assigned_to": task["assigned_to"],
-        "assigned_to_name": task["assigned_to_name"],
-        "created_at": task["created_at"].isoformat(),
-        "updated_at": task["updated_at"].isoformat()
-    }
+    return group_task_response(task)
 
 @api_router.patch("/groups/{group_id}/tasks/{task_id}")
 async def update_group_task(group_id: str, task_id: str, updates: GroupTaskUpdate, current_user: dict = Depends(get_current_user)):
     # Verify membership
     group = await db.groups.find_one({
         "id": group_id,
-        "members.user_id": current_user["id"]
-    })
+        "member_ids": current_user["id"]
+    }, {"_id": 0, "members": 1})
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found or access denied")
@@ -690,11 +856,7 @@ async def update_group_task(group_id: str, task_id: str, updates: GroupTaskUpdat
     if member["role"] == "viewer":
         raise HTTPException(status_code=403, detail="Viewers cannot update tasks")
     
-    task = await db.group_tasks.find_one({"id": task_id, "group_id": group_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    update_data = {k: v for k, v in updates.dict().items() if v is not None}
+    update_data = updates.model_dump(exclude_unset=True)
     
     # Update assigned_to_name if assigned_to changes
     if "assigned_to" in update_data:
@@ -704,33 +866,26 @@ async def update_group_task(group_id: str, task_id: str, updates: GroupTaskUpdat
         else:
             update_data["assigned_to_name"] = None
     
-    update_data["updated_at"] = datetime.utcnow()
+    update_data["updated_at"] = utc_now()
     
-    await db.group_tasks.update_one({"id": task_id}, {"$set": update_data})
+    updated_task = await db.group_tasks.find_one_and_update(
+        {"id": task_id, "group_id": group_id},
+        {"$set": update_data},
+        projection=GROUP_TASK_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_task:
+        raise HTTPException(status_code=404, detail="Task not found")
     
-    updated_task = await db.group_tasks.find_one({"id": task_id})
-    return {
-        "id": updated_task["id"],
-        "title": updated_task["title"],
-        "description": updated_task.get("description", ""),
-        "status": updated_task.get("status", "todo"),
-        "priority": updated_task.get("priority", "medium"),
-        "due_date": updated_task.get("due_date"),
-        "group_id": updated_task["group_id"],
-        "created_by": updated_task["created_by"],
-        "assigned_to": updated_task.get("assigned_to"),
-        "assigned_to_name": updated_task.get("assigned_to_name"),
-        "created_at": updated_task["created_at"].isoformat() if isinstance(updated_task["created_at"], datetime) else updated_task["created_at"],
-        "updated_at": updated_task["updated_at"].isoformat() if isinstance(updated_task["updated_at"], datetime) else updated_task["updated_at"]
-    }
+    return group_task_response(updated_task)
 
 @api_router.delete("/groups/{group_id}/tasks/{task_id}")
 async def delete_group_task(group_id: str, task_id: str, current_user: dict = Depends(get_current_user)):
     # Verify membership
     group = await db.groups.find_one({
         "id": group_id,
-        "members.user_id": current_user["id"]
-    })
+        "member_ids": current_user["id"]
+    }, {"_id": 0, "members": {"$elemMatch": {"user_id": current_user["id"]}}})
     
     if not group:
         raise HTTPException(status_code=404, detail="Group not found or access denied")
@@ -767,7 +922,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()